@@ -1,185 +1,763 @@
 import streamlit as st
 import sys
 import os
-import json
+import math
+import orjson
+import hashlib
+import gzip
+import uuid
+import dataclasses
+import numpy as np
 import pandas as pd
-from io import StringIO
-import plotly.graph_objects as go
-import plotly.express as px
+from io import BytesIO
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 os.environ['PYARROW_IGNORE_TIMEZONE'] = '1'
 
 # Add src to path to import the modules
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from extractor import InvoiceExtractor
+from document_agent import DocumentAgent
 from smart_validator import SmartValidator
+from models import ValidationResult
 
-def display_invoice_result(invoice, validation, filename):
-    """Display a single invoice result with formatting"""
-    
-    # Determine card style based on validation
-    if validation.is_valid and not validation.warnings:
-        card_class = "valid-card"
-        status_icon = "✅"
-        status_text = "VALID"
-    elif validation.is_valid and validation.warnings:
-        card_class = "warning-card"
-        status_icon = "⚠️"
-        status_text = "VALID (with warnings)"
-    else:
-        card_class = "invalid-card"
-        status_icon = "❌"
-        status_text = "INVALID"
-    
-    # Invoice header card
-    st.markdown(f"""
-    <div class="invoice-card {card_class}">
-        <h3>{status_icon} {invoice.invoice_number} - {status_text}</h3>
-        <p><strong>File:</strong> {filename}</p>
-    </div>
-    """, unsafe_allow_html=True)
+MAX_WORKERS = 8  # Concurrent files per batch; bounded by the OpenAI rate limit, not CPU
+
+RESULTS_PAGE_SIZE = 20  # Invoices rendered per page in the Results tab
+
+LINE_ITEMS_PAGE_SIZE = 500  # Line items sent to the browser at once for a single invoice
+
+LINE_ITEM_COLUMN_CONFIG = {
+    "Quantity": st.column_config.NumberColumn(format="%.2f"),
+    "Unit Price": st.column_config.NumberColumn(format="$%.2f"),
+    "Amount": st.column_config.NumberColumn(format="$%.2f"),
+}
+
+# (is_valid, has_warnings) -> (icon, status label, Streamlit text colour)
+STATUS_CARD_STYLES = {
+    (True, False): ("✅", "VALID", "green"),
+    (True, True): ("⚠️", "VALID (with warnings)", "orange"),
+    (False, False): ("❌", "INVALID", "red"),
+    (False, True): ("❌", "INVALID", "red"),
+}
+
+# Static page chrome, built once at import rather than on every rerun
+APP_CSS = """
+    <style>
+    .main {
+        padding: 2rem;
+    }
+    .stAlert {
+        margin-top: 1rem;
+    }
+    </style>
+"""
+
+ABOUT_MARKDOWN = """
+    This system uses:
+    - **GPT-4** for data extraction
+    - **Rule-based validation** for math & format checks
+    - **AI semantic analysis** for context understanding
+    
+    **Features:**
+    - ✅ Extract structured data from invoices
+    - ✅ Validate calculations and formats
+    - ✅ Detect duplicates and suspicious patterns
+    - ✅ Batch processing support
+    - ✅ Export to JSON/CSV
+    - ✅ Visual analytics dashboard
+"""
+
+FOOTER_HTML = """
+<div style='text-align: center; color: #666; padding: 2rem;'>
+    <p>Built with Streamlit, OpenAI GPT-4, and Python</p>
+    <p>Smart Document Processing Agent v1.0</p>
+</div>
+"""
+
+# Sample invoice templates for the testing tools; {stamp} and {date} are filled in on demand
+SAMPLE_TEMPLATES = {
+    "Valid Invoice": """INVOICE
+
+Bill To:                          Invoice Number: INV-TEST-{stamp}
+Test Company Pty Ltd              Date: {date}
+123 Test Street                   Due Date: {date}
+Melbourne VIC 3000
+
+From:
+Sample Vendor Ltd
+456 Vendor Ave
+Sydney NSW 2000
+ABN: 12 345 678 901
+
+Description                       Quantity    Unit Price    Amount
+----------------------------------------------------------------
+Professional Services            10 hours    $150.00       $1,500.00
+Software License                 1           $500.00       $500.00
+
+                                             Subtotal:      $2,000.00
+                                             GST (10%):     $200.00
+                                             Total:         $2,200.00
+
+Payment Terms: Net 30 days
+""",
+    "Invoice with Math Error": """INVOICE
+
+Invoice Number: INV-ERROR-{stamp}
+Date: {date}
+
+From: Test Vendor
+To: Test Customer
+
+Line Items:
+Item A    5    $100.00    $500.00
+Item B    3    $200.00    $650.00  <- ERROR: Should be $600.00
+
+Subtotal: $1,150.00  <- ERROR: Should be $1,100.00
+GST: $115.00
+Total: $1,265.00
+""",
+    "Duplicate Warning": """INVOICE
+
+Invoice Number: INV-DUP-{stamp}
+Date: {date}
+
+From: Test Vendor
+To: Test Customer
+
+Line Items:
+Service A    1    $1,000.00    $1,000.00
+
+Subtotal: $1,000.00
+GST: $100.00
+Total: $1,100.00
+
+NOTE: This is a DUPLICATE of previous invoice INV-2024-999
+""",
+    "High Value Invoice": """INVOICE
+
+Invoice Number: INV-HIGH-{stamp}
+Date: {date}
+
+From: Enterprise Vendor Ltd
+To: Large Customer Corp
+
+Line Items:
+Enterprise Software Suite    1    $75,000.00    $75,000.00
+Implementation Services      200 hours    $250.00    $50,000.00
+
+Subtotal: $125,000.00
+GST: $12,500.00
+Total: $137,500.00
+""",
+}
+
+@st.cache_resource
+def get_agent():
+    """Shared document agent (extraction plus AI review), created once per server process"""
+    return DocumentAgent()
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def analyze_cached(content_digest, prompt_date, _agent, _raw):
+    """Extract and AI-review an invoice in one call, memoized on the digest of its content so
+    repeats skip the API call (and the decode; the raw bytes are only decoded on a cache miss).
+    
+    The review prompt includes today's date (overdue and future-dated findings depend
+    on it), so prompt_date is part of the key and a later day's upload is reviewed afresh.
+    """
+    return _agent.analyze_bytes(_raw)
+
+def get_validator():
+    """Per-session validator (it remembers processed invoice numbers for duplicate checks)"""
+    if 'validator' not in st.session_state:
+        # Share the cached agent's OpenAI client rather than building one per session
+        st.session_state.validator = SmartValidator(client=get_agent().client)
+    return st.session_state.validator
+
+def bullet_lines(messages):
+    """Messages as one markdown block of bullet lines; "$" is escaped so amounts aren't read as LaTeX"""
+    return "  \n".join("• " + message.replace("$", "\\$") for message in messages)
+
+def display_invoice_result(invoice, validation, filename, show_details=True, key="invoice"):
+    """Display a single invoice result with formatting (key keeps its widgets unique per card)"""
+    
+    # Invoice header card, built from native elements rather than sanitized HTML
+    status_icon, status_text, color = STATUS_CARD_STYLES[(bool(validation.is_valid), bool(validation.warnings))]
+    with st.container(border=True):
+        st.subheader(f"{status_icon} :{color}[{invoice.invoice_number} - {status_text}]")
+        st.caption(f"File: {filename}")
+    
+    if not show_details:
+        return
     
     # Details in expandable sections
-    with st.expander("📋 Invoice Details", expanded=True):
+    with st.expander("📋 Invoice Details", expanded=False):
         col1, col2, col3 = st.columns(3)
         
+        # One markdown element per column ("  \n" is a markdown line break)
         with col1:
-            st.markdown("**Basic Information**")
-            st.write(f"**Invoice Number:** {invoice.invoice_number}")
-            st.write(f"**Date:** {invoice.invoice_date}")
-            st.write(f"**Due Date:** {invoice.due_date}")
+            st.markdown(
+                f"**Basic Information**  \n"
+                f"**Invoice Number:** {invoice.invoice_number}  \n"
+                f"**Date:** {invoice.invoice_date}  \n"
+                f"**Due Date:** {invoice.due_date}"
+            )
         
         with col2:
-            st.markdown("**Vendor Information**")
-            st.write(f"**Name:** {invoice.vendor_name}")
+            vendor_lines = f"**Vendor Information**  \n**Name:** {invoice.vendor_name}"
             if invoice.vendor_abn:
-                st.write(f"**ABN:** {invoice.vendor_abn}")
+                vendor_lines += f"  \n**ABN:** {invoice.vendor_abn}"
+            st.markdown(vendor_lines)
         
         with col3:
-            st.markdown("**Customer Information**")
-            st.write(f"**Name:** {invoice.customer_name}")
+            st.markdown(f"**Customer Information**  \n**Name:** {invoice.customer_name}")
     
-    with st.expander("🧾 Line Items", expanded=True):
-        # Create a nice table for line items
+    with st.expander("🧾 Line Items", expanded=False):
+        # Keep numbers numeric and let the client format them
         if invoice.line_items:
-            line_items_data = []
-            for item in invoice.line_items:
-                line_items_data.append({
-                    "Description": item.description,
-                    "Quantity": f"{item.quantity:,.2f}",
-                    "Unit Price": f"${item.unit_price:,.2f}",
-                    "Amount": f"${item.amount:,.2f}"
-                })
+            items = invoice.line_items
+            quantities, unit_prices, amounts = invoice.as_arrays()
+            
+            # Very long invoices are paged so only a slice is serialized to the browser
+            if len(items) > LINE_ITEMS_PAGE_SIZE:
+                page_count = math.ceil(len(items) / LINE_ITEMS_PAGE_SIZE)
+                page = st.number_input(
+                    f"Line item page (of {page_count})", min_value=1, max_value=page_count,
+                    value=1, step=1, key=f"{key}_line_items_page"
+                )
+                window = slice((page - 1) * LINE_ITEMS_PAGE_SIZE, page * LINE_ITEMS_PAGE_SIZE)
+                items = items[window]
+                quantities, unit_prices, amounts = quantities[window], unit_prices[window], amounts[window]
             
-            st.table(line_items_data)
+            line_items_df = pd.DataFrame({
+                "Description": [item.description for item in items],
+                "Quantity": quantities,
+                "Unit Price": unit_prices,
+                "Amount": amounts,
+            })
+            
+            st.dataframe(
+                line_items_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config=LINE_ITEM_COLUMN_CONFIG
+            )
             
             # Totals
             col1, col2, col3 = st.columns([2, 1, 1])
             with col2:
-                st.markdown("**Subtotal:**")
-                st.markdown("**Tax:**")
-                st.markdown("**Total:**")
+                st.markdown("**Subtotal:**  \n**Tax:**  \n**Total:**")
             with col3:
-                st.markdown(f"${invoice.subtotal:,.2f}")
-                st.markdown(f"${invoice.tax_amount:,.2f}")
-                st.markdown(f"**${invoice.total_amount:,.2f}**")
+                # Dollar signs escaped so several in one element aren't read as LaTeX
+                st.markdown(
+                    f"\\${invoice.subtotal:,.2f}  \n"
+                    f"\\${invoice.tax_amount:,.2f}  \n"
+                    f"**\\${invoice.total_amount:,.2f}**"
+                )
     
-    with st.expander("🔍 Validation Results", expanded=True):
+    with st.expander("🔍 Validation Results", expanded=False):
         if validation.issues:
             st.markdown("#### 🚨 Critical Issues")
-            for issue in validation.issues:
-                st.error(f"• {issue}")
+            st.error(bullet_lines(validation.issues))
         
         if validation.warnings:
             st.markdown("#### ⚠️ Warnings")
-            for warning in validation.warnings:
-                st.warning(f"• {warning}")
+            st.warning(bullet_lines(validation.warnings))
         
         if not validation.issues and not validation.warnings:
             st.success("✅ No issues or warnings detected. Invoice looks good!")
 
+SUMMARY_CSV_SCHEMA = pa.schema([
+    ('Filename', pa.string()),
+    ('Invoice Number', pa.string()),
+    ('Invoice Date', pa.string()),
+    ('Due Date', pa.string()),
+    ('Vendor Name', pa.string()),
+    ('Vendor ABN', pa.string()),
+    ('Customer Name', pa.string()),
+    ('Subtotal', pa.float64()),
+    ('Tax Amount', pa.float64()),
+    ('Total Amount', pa.float64()),
+    ('Line Items Count', pa.int64()),
+    ('Status', pa.string()),
+    ('Issues Count', pa.int64()),
+    ('Warnings Count', pa.int64()),
+    ('Issues', pa.string()),
+    ('Warnings', pa.string()),
+])
+
+LINE_ITEMS_CSV_SCHEMA = pa.schema([
+    ('Invoice Number', pa.string()),
+    ('Vendor Name', pa.string()),
+    ('Line Item Description', pa.string()),
+    ('Quantity', pa.float64()),
+    ('Unit Price', pa.float64()),
+    ('Amount', pa.float64()),
+])
+
+CSV_PREVIEW_ROWS = 50  # Rows parsed back for the in-app preview
+
+def as_text(column):
+    """String column values as str; the model can return numbers (e.g. an invoice number
+    of 10042) for fields the schema treats as text. None stays None"""
+    return [None if value is None else str(value) for value in column]
+
+def write_csv(rows, schema):
+    """Write row tuples (in schema column order) to CSV bytes with Arrow's C++ writer"""
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    table = pa.Table.from_arrays(
+        [
+            pa.array(as_text(column) if field.type == pa.string() else column, type=field.type)
+            for column, field in zip(columns, schema)
+        ],
+        schema=schema
+    )
+    
+    sink = BytesIO()
+    pacsv.write_csv(table, sink)
+    return sink.getvalue()
+
 def export_to_csv(results):
     """Convert results to CSV format"""
-    data = []
+    rows = []
     
     for result in results:
         invoice = result['invoice']
         validation = result['validation']
         
-        # Basic invoice data
-        row = {
-            'Filename': result['filename'],
-            'Invoice Number': invoice.invoice_number,
-            'Invoice Date': invoice.invoice_date,
-            'Due Date': invoice.due_date,
-            'Vendor Name': invoice.vendor_name,
-            'Vendor ABN': invoice.vendor_abn or '',
-            'Customer Name': invoice.customer_name,
-            'Subtotal': invoice.subtotal,
-            'Tax Amount': invoice.tax_amount,
-            'Total Amount': invoice.total_amount,
-            'Line Items Count': len(invoice.line_items),
-            'Status': 'VALID' if validation.is_valid else 'INVALID',
-            'Issues Count': len(validation.issues),
-            'Warnings Count': len(validation.warnings),
-            'Issues': ' | '.join(validation.issues) if validation.issues else '',
-            'Warnings': ' | '.join(validation.warnings) if validation.warnings else '',
-        }
-        data.append(row)
-    
-    df = pd.DataFrame(data)
-    return df
+        # Basic invoice data, in SUMMARY_CSV_SCHEMA order
+        rows.append((
+            result['filename'],
+            invoice.invoice_number,
+            invoice.invoice_date,
+            invoice.due_date,
+            invoice.vendor_name,
+            invoice.vendor_abn or '',
+            invoice.customer_name,
+            invoice.subtotal,
+            invoice.tax_amount,
+            invoice.total_amount,
+            len(invoice.line_items),
+            'VALID' if validation.is_valid else 'INVALID',
+            len(validation.issues),
+            len(validation.warnings),
+            ' | '.join(validation.issues),  # '' for an empty list
+            ' | '.join(validation.warnings),
+        ))
+    
+    return write_csv(rows, SUMMARY_CSV_SCHEMA)
 
 def export_line_items_to_csv(results):
     """Export detailed line items to CSV"""
-    data = []
+    rows = []
     
     for result in results:
         invoice = result['invoice']
+        invoice_number = invoice.invoice_number
+        vendor_name = invoice.vendor_name
         
-        for item in invoice.line_items:
-            row = {
-                'Invoice Number': invoice.invoice_number,
-                'Vendor Name': invoice.vendor_name,
-                'Line Item Description': item.description,
-                'Quantity': item.quantity,
-                'Unit Price': item.unit_price,
-                'Amount': item.amount,
-            }
-            data.append(row)
+        # Plain tuples in LINE_ITEMS_CSV_SCHEMA order; no per-item dict needed
+        rows.extend(
+            (invoice_number, vendor_name, item.description, item.quantity, item.unit_price, item.amount)
+            for item in invoice.line_items
+        )
+    
+    return write_csv(rows, LINE_ITEMS_CSV_SCHEMA)
+
+def export_record(result):
+    """JSON-ready record for a single processed invoice"""
+    # Invoices go through to_dict() so raw_text stays out of the export; the validation
+    # dataclass has nothing to drop, so orjson serializes it natively without a dict copy
+    return {
+        'filename': result['filename'],
+        'invoice': result['invoice'].to_dict(),
+        'validation': result['validation']
+    }
+
+def export_to_json(results):
+    """Serialize results as a JSON array, encoding one invoice at a time"""
+    buf = BytesIO()
+    buf.write(b'[\n')
+    
+    for idx, result in enumerate(results):
+        if idx:
+            buf.write(b',\n')
+        buf.write(orjson.dumps(export_record(result), option=orjson.OPT_INDENT_2))
+    
+    buf.write(b'\n]')
+    return buf.getvalue()
+
+def prepare_download(data, file_name, mime, compress=False):
+    """Optionally gzip an export payload (bytes) before it is handed to st.download_button"""
+    if not compress:
+        return data, file_name, mime
+    
+    # Level 1 keeps CPU cost low and still gets most of the size reduction on text
+    return gzip.compress(data, compresslevel=1), f"{file_name}.gz", "application/gzip"
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def results_frame(results_version, _results):
+    """One row per processed invoice, so dashboards can aggregate with vectorized pandas ops"""
+    n = len(_results)
+    
+    # Preallocated typed columns, filled in one pass (no per-row records or dtype inference)
+    filename = np.empty(n, dtype=object)
+    invoice_number = np.empty(n, dtype=object)
+    vendor_name = np.empty(n, dtype=object)
+    subtotal = np.empty(n, dtype=np.float64)
+    tax_amount = np.empty(n, dtype=np.float64)
+    total_amount = np.empty(n, dtype=np.float64)
+    line_item_count = np.empty(n, dtype=np.int64)
+    is_valid = np.empty(n, dtype=bool)
+    issue_count = np.empty(n, dtype=np.int64)
+    warning_count = np.empty(n, dtype=np.int64)
     
-    df = pd.DataFrame(data)
-    return df
+    for i, r in enumerate(_results):
+        invoice = r['invoice']
+        validation = r['validation']
+        filename[i] = r['filename']
+        invoice_number[i] = invoice.invoice_number
+        vendor_name[i] = invoice.vendor_name
+        subtotal[i] = invoice.subtotal
+        tax_amount[i] = invoice.tax_amount
+        total_amount[i] = invoice.total_amount
+        line_item_count[i] = len(invoice.line_items)
+        is_valid[i] = validation.is_valid
+        issue_count[i] = len(validation.issues)
+        warning_count[i] = len(validation.warnings)
+    
+    return pd.DataFrame({
+        'filename': filename,
+        'invoice_number': invoice_number,
+        'vendor_name': vendor_name,
+        'subtotal': subtotal,
+        'tax_amount': tax_amount,
+        'total_amount': total_amount,
+        'line_item_count': line_item_count,
+        'is_valid': is_valid,
+        'issue_count': issue_count,
+        'warning_count': warning_count,
+    })
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def dashboard_stats(results_version, _results):
+    """Aggregates behind the Dashboard tab, computed once per results version"""
+    df = results_frame(results_version, _results)
+    
+    vendor_stats = df.groupby('vendor_name', sort=False, dropna=False).agg(
+        count=('invoice_number', 'size'),
+        total=('total_amount', 'sum'),
+        valid=('is_valid', 'sum')
+    )
+    
+    invoice_numbers = df['invoice_number'].to_numpy()
+    amounts = df['total_amount'].to_numpy()
+    is_valid = df['is_valid'].to_numpy()
+    
+    # All column totals in a single reduction rather than one pass per metric
+    totals = df[['is_valid', 'total_amount', 'subtotal', 'tax_amount',
+                 'line_item_count', 'issue_count', 'warning_count']].sum()
+    
+    # Only invoices that have issues are revisited. Counter.most_common breaks ties by
+    # first occurrence, so the list is stable between identical runs
+    issue_counts = Counter(
+        issue
+        for i in np.flatnonzero(df['issue_count'].to_numpy())
+        for issue in _results[i]['validation'].issues
+    )
+    top_issues = [
+        (f"{issue[:80]}{'...' if len(issue) > 80 else ''}", count)
+        for issue, count in issue_counts.most_common(5)
+    ]
+    
+    return {
+        'total': len(df),
+        'valid': int(totals['is_valid']),
+        'total_value': float(totals['total_amount']),
+        'total_subtotal': float(totals['subtotal']),
+        'total_tax': float(totals['tax_amount']),
+        'highest': float(df['total_amount'].max()),
+        'total_items': int(totals['line_item_count']),
+        'issue_count': int(totals['issue_count']),
+        'warning_count': int(totals['warning_count']),
+        'top_issues': top_issues,
+        # Bar chart inputs, pre-split by status so the figure needs no grouping
+        'valid_invoices': invoice_numbers[is_valid],
+        'valid_amounts': amounts[is_valid],
+        'invalid_invoices': invoice_numbers[~is_valid],
+        'invalid_amounts': amounts[~is_valid],
+        'vendor_df': pd.DataFrame({
+            'Vendor': vendor_stats.index,
+            'Invoices': vendor_stats['count'].to_numpy(),
+            'Total': [f"${value:,.2f}" for value in vendor_stats['total']],
+            'Valid Rate': [f"{rate:.0f}%" for rate in vendor_stats['valid'] / vendor_stats['count'] * 100]
+        }),
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def summary_csv(results_version, _results):
+    """Summary CSV for a results version, so regenerating unchanged results is a lookup"""
+    return export_to_csv(_results)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def line_items_csv(results_version, _results):
+    """Line items CSV for a results version"""
+    return export_line_items_to_csv(_results)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def results_json(results_version, _results):
+    """JSON export for a results version, so Export tab reruns don't re-encode every invoice"""
+    return export_to_json(_results)
+
+def bump_results_version():
+    """Mark the session's results as changed so cached views of them are rebuilt.
+    
+    The version is a random token rather than a counter because Streamlit caches
+    are shared across sessions, and two sessions must never share a key.
+    """
+    st.session_state.results_version = uuid.uuid4().hex
+
+def clear_results():
+    """Reset processed results and session statistics"""
+    st.session_state.results = []
+    bump_results_version()
+    st.session_state.processed_count = 0
+    st.session_state.valid_count = 0
+    st.session_state.invalid_count = 0
+    st.session_state.success_rate = 0
+    if 'validator' in st.session_state:
+        st.session_state.validator.reset()
 
-def process_with_status(uploaded_file, extractor, validator, show_logs=False):
-    """Process a single invoice with detailed status updates"""
+def upload_digest(uploaded_file):
+    """Content digest of an uploaded file, used to spot identical uploads"""
+    return hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+
+def duplicate_upload_result(original, filename):
+    """Result for a file whose content matches an earlier upload in the same batch"""
+    invoice = original['invoice']
+    issues = [f"DUPLICATE: Invoice {invoice.invoice_number} already processed"]
+    issues += [issue for issue in original['validation'].issues if issue not in issues]
+    
+    return {
+        'invoice': invoice,
+        'validation': ValidationResult(
+            is_valid=False,
+            issues=issues,
+            warnings=list(original['validation'].warnings)
+        ),
+        'filename': filename
+    }
+
+def process_with_status(uploaded_file, agent, show_logs=False, content_digest=None):
+    """Extract and AI-review a single invoice with detailed status updates.
+    
+    Safe to run on a worker thread: the per-session rule checks (and their
+    duplicate tracking) are left to the caller, in upload order. Status lines are
+    returned rather than written, for the caller to show on the script thread.
+    """
+    log = []
     try:
         if show_logs:
-            st.write(f"📄 Reading file: {uploaded_file.name}")
+            log.append(f"📄 Reading file: {uploaded_file.name}")
         
-        invoice_text = uploaded_file.read().decode('utf-8')
+        # getvalue() hands back the upload's buffer without copying or re-reading the stream
+        raw = uploaded_file.getvalue()
         
         if show_logs:
-            st.write(f"📝 Text length: {len(invoice_text)} characters")
-            st.write("🤖 Calling extraction API...")
+            log.append(f"📝 File size: {len(raw)} bytes")
+            log.append("🤖 Calling extraction & review API...")
         
-        invoice = extractor.extract_from_text(invoice_text)
+        if content_digest is None:
+            content_digest = upload_digest(uploaded_file)
+        # One model call returns both the invoice and the AI review
+        invoice, ai_validation = analyze_cached(content_digest, datetime.now().date().isoformat(), agent, raw)
         
         if show_logs:
-            st.write(f"✅ Extracted {len(invoice.line_items)} line items")
-            st.write("🔍 Running validation...")
+            log.append(f"✅ Extracted {len(invoice.line_items)} line items")
         
-        validation = validator.validate(invoice)
+        return invoice, ai_validation, None, log
         
-        if show_logs:
-            st.write(f"✅ Validation complete: {len(validation.issues)} issues, {len(validation.warnings)} warnings")
+    except Exception as e:
+        return None, None, str(e), log
+
+@st.fragment
+def render_results_tab():
+    """Results tab; a fragment, so paging and the details toggle rerun only this tab"""
+    st.header("Processing Results")
+    
+    if 'results' in st.session_state and st.session_state.results:
+        results = st.session_state.results
+        total = len(results)
+        st.write(f"**Total Processed:** {total} invoice(s)")
         
-        return invoice, validation, None
+        # Only render one page of invoices per rerun
+        page_count = max(1, math.ceil(total / RESULTS_PAGE_SIZE))
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key="results_page")
+        with col2:
+            show_details = st.checkbox("Show details", value=True, key="results_show_details")
         
-    except Exception as e:
-        return None, None, str(e)
+        start = (page - 1) * RESULTS_PAGE_SIZE
+        end = min(start + RESULTS_PAGE_SIZE, total)
+        st.caption(f"Showing invoices {start + 1}-{end} of {total}")
+        
+        for idx, result in enumerate(results[start:end], start=start):
+            st.markdown(f"### Invoice {idx + 1}")
+            display_invoice_result(
+                result['invoice'],
+                result['validation'],
+                result['filename'],
+                show_details=show_details,
+                key=f"invoice_{idx}"
+            )
+            st.markdown("---")
+    else:
+        st.info("📭 No invoices processed yet. Upload and process an invoice in the 'Upload & Process' tab.")
+
+@st.fragment
+def render_export_tab():
+    """Export tab; a fragment, so generating exports reruns only this tab"""
+    st.header("Export Results")
+    
+    if 'results' in st.session_state and st.session_state.results:
+        st.write(f"📊 Export {len(st.session_state.results)} processed invoice(s)")
+        
+        # Export options
+        st.subheader("Choose Export Format")
+        
+        compress_downloads = st.checkbox(
+            "Compress downloads (.gz)",
+            value=False,
+            help="Gzip the exported files to shrink large downloads"
+        )
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.markdown("#### 📄 Summary CSV")
+            st.write("Invoice-level summary with validation results")
+            
+            if st.button("Generate Summary CSV", use_container_width=True):
+                csv_data = summary_csv(st.session_state.results_version, st.session_state.results)
+                
+                data, file_name, mime = prepare_download(csv_data, "invoice_summary.csv", "text/csv", compress_downloads)
+                st.download_button(
+                    label="⬇️ Download Summary CSV",
+                    data=data,
+                    file_name=file_name,
+                    mime=mime,
+                    use_container_width=True
+                )
+                
+                with st.expander("Preview Summary CSV"):
+                    preview_df = pd.read_csv(BytesIO(csv_data), nrows=CSV_PREVIEW_ROWS)
+                    st.dataframe(preview_df, use_container_width=True)
+        
+        with col2:
+            st.markdown("#### 🧾 Line Items CSV")
+            st.write("Detailed line-by-line item breakdown")
+            
+            if st.button("Generate Line Items CSV", use_container_width=True):
+                csv_data = line_items_csv(st.session_state.results_version, st.session_state.results)
+                
+                data, file_name, mime = prepare_download(csv_data, "invoice_line_items.csv", "text/csv", compress_downloads)
+                st.download_button(
+                    label="⬇️ Download Line Items CSV",
+                    data=data,
+                    file_name=file_name,
+                    mime=mime,
+                    use_container_width=True
+                )
+                
+                with st.expander("Preview Line Items CSV"):
+                    preview_df = pd.read_csv(BytesIO(csv_data), nrows=CSV_PREVIEW_ROWS)
+                    st.dataframe(preview_df, use_container_width=True)
+        
+        with col3:
+            st.markdown("#### 📦 Complete JSON")
+            st.write("Full data export with all details")
+            
+            json_bytes = results_json(st.session_state.results_version, st.session_state.results)
+            
+            data, file_name, mime = prepare_download(
+                json_bytes, "processed_invoices.json", "application/json", compress_downloads
+            )
+            st.download_button(
+                label="⬇️ Download JSON",
+                data=data,
+                file_name=file_name,
+                mime=mime,
+                use_container_width=True
+            )
+            
+            with st.expander("Preview JSON Structure"):
+                # Shown through orjson too, so the preview matches the exported bytes exactly
+                st.json(orjson.dumps(export_record(st.session_state.results[0])).decode('utf-8'))
+        
+        # Show export statistics
+        st.markdown("---")
+        st.subheader("Export Statistics")
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        df = results_frame(st.session_state.results_version, st.session_state.results)
+        total_amount = float(df['total_amount'].sum())
+        valid_amount = float(df.loc[df['is_valid'], 'total_amount'].sum())
+        total_items = int(df['line_item_count'].sum())
+        
+        with col1:
+            st.metric("Total Invoice Value", f"${total_amount:,.2f}")
+        with col2:
+            st.metric("Valid Invoice Value", f"${valid_amount:,.2f}")
+        with col3:
+            st.metric("Total Line Items", total_items)
+        with col4:
+            avg_items = total_items / len(st.session_state.results)
+            st.metric("Avg Items/Invoice", f"{avg_items:.1f}")
+        
+    else:
+        st.info("📭 No results to export yet. Process some invoices first!")
+        
+        st.markdown("---")
+        st.subheader("Available Export Formats")
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.markdown("#### 📄 Summary CSV")
+            st.write("""
+            - Invoice number, dates, amounts
+            - Vendor and customer info
+            - Validation status
+            - Issue and warning counts
+            - Perfect for accounting systems
+            """)
+        
+        with col2:
+            st.markdown("#### 🧾 Line Items CSV")
+            st.write("""
+            - Detailed line item breakdown
+            - Item descriptions and quantities
+            - Pricing information
+            - Linked to invoice numbers
+            - Great for inventory tracking
+            """)
+        
+        with col3:
+            st.markdown("#### 📦 Complete JSON")
+            st.write("""
+            - Full structured data export
+            - All extracted fields
+            - Complete validation results
+            - API-ready format
+            - For system integration
+            """)
 
 # Page configuration
 st.set_page_config(
@@ -190,33 +768,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
-    <style>
-    .main {
-        padding: 2rem;
-    }
-    .stAlert {
-        margin-top: 1rem;
-    }
-    .invoice-card {
-        padding: 1.5rem;
-        border-radius: 0.5rem;
-        margin: 1rem 0;
-    }
-    .valid-card {
-        background-color: #d4edda;
-        border: 2px solid #28a745;
-    }
-    .invalid-card {
-        background-color: #f8d7da;
-        border: 2px solid #dc3545;
-    }
-    .warning-card {
-        background-color: #fff3cd;
-        border: 2px solid #ffc107;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # Title and description
 st.title("📄 Smart Document Processing Agent")
@@ -239,20 +791,7 @@ if 'results' not in st.session_state or len(st.session_state.get('results', []))
 # Sidebar
 with st.sidebar:
     st.header("ℹ️ About")
-    st.markdown("""
-    This system uses:
-    - **GPT-4** for data extraction
-    - **Rule-based validation** for math & format checks
-    - **AI semantic analysis** for context understanding
-    
-    **Features:**
-    - ✅ Extract structured data from invoices
-    - ✅ Validate calculations and formats
-    - ✅ Detect duplicates and suspicious patterns
-    - ✅ Batch processing support
-    - ✅ Export to JSON/CSV
-    - ✅ Visual analytics dashboard
-    """)
+    st.markdown(ABOUT_MARKDOWN)
     
     st.markdown("---")
     st.header("📊 Session Statistics")
@@ -264,8 +803,12 @@ with st.sidebar:
         st.session_state.valid_count = 0
     if 'invalid_count' not in st.session_state:
         st.session_state.invalid_count = 0
+    if 'success_rate' not in st.session_state:
+        st.session_state.success_rate = 0  # Updated only when the counters change
     if 'total_api_calls' not in st.session_state:
         st.session_state.total_api_calls = 0
+    if 'results_version' not in st.session_state:
+        bump_results_version()
     
     col1, col2 = st.columns(2)
     with col1:
@@ -273,8 +816,7 @@ with st.sidebar:
         st.metric("Valid", st.session_state.valid_count)
     with col2:
         st.metric("Invalid", st.session_state.invalid_count)
-        success_rate = (st.session_state.valid_count / st.session_state.processed_count * 100) if st.session_state.processed_count > 0 else 0
-        st.metric("Success Rate", f"{success_rate:.0f}%")
+        st.metric("Success Rate", f"{st.session_state.success_rate:.0f}%")
     
     st.markdown("---")
     st.header("🛠️ Settings")
@@ -302,92 +844,20 @@ with st.sidebar:
         
         sample_type = st.selectbox(
             "Sample type:",
-            ["Valid Invoice", "Invoice with Math Error", "Duplicate Warning", "High Value Invoice"]
+            list(SAMPLE_TEMPLATES)
         )
         
         if st.button("Generate Sample", use_container_width=True):
-            if sample_type == "Valid Invoice":
-                sample_text = f"""INVOICE
-
-Bill To:                          Invoice Number: INV-TEST-{datetime.now().strftime('%Y%m%d-%H%M%S')}
-Test Company Pty Ltd              Date: {datetime.now().strftime('%B %d, %Y')}
-123 Test Street                   Due Date: {datetime.now().strftime('%B %d, %Y')}
-Melbourne VIC 3000
-
-From:
-Sample Vendor Ltd
-456 Vendor Ave
-Sydney NSW 2000
-ABN: 12 345 678 901
-
-Description                       Quantity    Unit Price    Amount
-----------------------------------------------------------------
-Professional Services            10 hours    $150.00       $1,500.00
-Software License                 1           $500.00       $500.00
-
-                                             Subtotal:      $2,000.00
-                                             GST (10%):     $200.00
-                                             Total:         $2,200.00
-
-Payment Terms: Net 30 days
-"""
-            elif sample_type == "Invoice with Math Error":
-                sample_text = f"""INVOICE
-
-Invoice Number: INV-ERROR-{datetime.now().strftime('%Y%m%d-%H%M%S')}
-Date: {datetime.now().strftime('%B %d, %Y')}
-
-From: Test Vendor
-To: Test Customer
-
-Line Items:
-Item A    5    $100.00    $500.00
-Item B    3    $200.00    $650.00  <- ERROR: Should be $600.00
-
-Subtotal: $1,150.00  <- ERROR: Should be $1,100.00
-GST: $115.00
-Total: $1,265.00
-"""
-            elif sample_type == "Duplicate Warning":
-                sample_text = f"""INVOICE
-
-Invoice Number: INV-DUP-{datetime.now().strftime('%Y%m%d-%H%M%S')}
-Date: {datetime.now().strftime('%B %d, %Y')}
-
-From: Test Vendor
-To: Test Customer
-
-Line Items:
-Service A    1    $1,000.00    $1,000.00
-
-Subtotal: $1,000.00
-GST: $100.00
-Total: $1,100.00
-
-NOTE: This is a DUPLICATE of previous invoice INV-2024-999
-"""
-            else:  # High Value Invoice
-                sample_text = f"""INVOICE
-
-Invoice Number: INV-HIGH-{datetime.now().strftime('%Y%m%d-%H%M%S')}
-Date: {datetime.now().strftime('%B %d, %Y')}
-
-From: Enterprise Vendor Ltd
-To: Large Customer Corp
-
-Line Items:
-Enterprise Software Suite    1    $75,000.00    $75,000.00
-Implementation Services      200 hours    $250.00    $50,000.00
-
-Subtotal: $125,000.00
-GST: $12,500.00
-Total: $137,500.00
-"""
+            now = datetime.now()
+            sample_text = SAMPLE_TEMPLATES[sample_type].format(
+                stamp=now.strftime('%Y%m%d-%H%M%S'),
+                date=now.strftime('%B %d, %Y')
+            )
             
             # Offer download
             st.download_button(
                 label="⬇️ Download Sample Invoice",
-                data=sample_text,
+                data=sample_text.encode('utf-8'),
                 file_name=f"sample_{sample_type.lower().replace(' ', '_')}.txt",
                 mime="text/plain",
                 use_container_width=True
@@ -439,65 +909,126 @@ with tab1:
     with col1:
         process_button = st.button("🚀 Process", type="primary", use_container_width=True)
     with col2:
-        if st.button("🗑️ Clear Results", use_container_width=True):
-            st.session_state.results = []
-            st.session_state.processed_count = 0
-            st.session_state.valid_count = 0
-            st.session_state.invalid_count = 0
-            st.rerun()
+        # Cleared in a callback, which runs before the rerun the click triggers
+        st.button("🗑️ Clear Results", on_click=clear_results, use_container_width=True)
     
     if uploaded_files and process_button:
-        # Initialize processors once
-        extractor = InvoiceExtractor()
-        validator = SmartValidator()
+        # Reuse processors across reruns
+        agent = get_agent()
+        validator = get_validator()
         
         # Process each file
         progress_bar = st.progress(0)
         status_text = st.empty()
         
         total_files = len(uploaded_files)
-        successful = 0
         failed = 0
-        
-        for idx, uploaded_file in enumerate(uploaded_files):
-            if uploaded_file is None:
-                continue
+        completed = 0
+        extracted = {}  # index -> (invoice, AI review) from the worker threads
+        show_logs = st.session_state.get('show_logs', False)
+        batch_results = {}
+        
+        # Only send the first copy of identical uploads to the agent
+        first_upload = {}  # content digest -> index of the first file with it
+        duplicate_of = {}  # index -> index of the earlier identical file
+        
+        # Extraction and AI review are network-bound, so run files concurrently
+        # Attach the script context so workers can use Streamlit caches
+        with ThreadPoolExecutor(
+            max_workers=MAX_WORKERS,
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        ) as executor:
+            futures = {}
+            for idx, uploaded_file in enumerate(uploaded_files):
+                if uploaded_file is None:
+                    continue
                 
-            try:
-                # Update progress
-                progress = (idx + 1) / total_files
-                progress_bar.progress(progress)
-                status_text.text(f"Processing {idx + 1}/{total_files}: {uploaded_file.name}")
+                digest = upload_digest(uploaded_file)
+                if digest in first_upload:
+                    duplicate_of[idx] = first_upload[digest]
+                    continue
+                first_upload[digest] = idx
                 
-                # Read the file
-                invoice_text = uploaded_file.read().decode('utf-8')
-                
-                # Extract and validate
-                invoice = extractor.extract_from_text(invoice_text)
-                validation = validator.validate(invoice)
-                
-                # Update statistics
-                st.session_state.processed_count += 1
-                if validation.is_valid:
-                    st.session_state.valid_count += 1
-                else:
-                    st.session_state.invalid_count += 1
-                
-                # Store results
-                if 'results' not in st.session_state:
-                    st.session_state.results = []
+                future = executor.submit(
+                    process_with_status, uploaded_file, agent,
+                    show_logs=show_logs, content_digest=digest
+                )
+                futures[future] = idx
+            
+            # Refresh the progress widgets at most ~20 times per batch
+            update_every = max(1, len(futures) // 20)
+            
+            for future in as_completed(futures):
+                idx = futures[future]
+                uploaded_file = uploaded_files[idx]
                 
-                st.session_state.results.append({
-                    'invoice': invoice,
-                    'validation': validation,
-                    'filename': uploaded_file.name
-                })
+                # Update progress
+                completed += 1
+                if completed % update_every == 0 or completed == len(futures):
+                    progress_bar.progress(completed / len(futures))
+                    status_text.text(f"Processed {completed}/{len(futures)}: {uploaded_file.name}")
                 
-                successful += 1
+                invoice, ai_validation, error, log = future.result()
+                if log:
+                    st.write("  \n".join(log))
+                if error:
+                    failed += 1
+                    st.error(f"❌ Failed to process {uploaded_file.name}: {error}")
+                    continue
                 
-            except Exception as e:
+                extracted[idx] = (invoice, ai_validation)
+        
+        # Rule checks run here, in upload order, so the first copy of an invoice number
+        # is the one kept and later uploads are flagged, whichever API call finished first
+        for idx in sorted(extracted):
+            invoice, ai_validation = extracted[idx]
+            validation = validator.validate_with_analysis(invoice, ai_validation)
+            if show_logs:
+                st.write(
+                    f"✅ Validated {uploaded_files[idx].name}: "
+                    f"{len(validation.issues)} issues, {len(validation.warnings)} warnings"
+                )
+            
+            # raw_text was only needed for validation; stored results keep just the
+            # extracted fields so a long session doesn't pin every upload's text
+            batch_results[idx] = {
+                'invoice': dataclasses.replace(invoice, raw_text=''),
+                'validation': validation,
+                'filename': uploaded_files[idx].name
+            }
+        
+        # Identical uploads reuse the first copy's extraction and are flagged as duplicates
+        for idx, original_idx in duplicate_of.items():
+            filename = uploaded_files[idx].name
+            if original_idx in batch_results:
+                batch_results[idx] = duplicate_upload_result(batch_results[original_idx], filename)
+            else:
                 failed += 1
-                st.error(f"❌ Failed to process {uploaded_file.name}: {str(e)}")
+                st.error(f"❌ Failed to process {filename}: same content as {uploaded_files[original_idx].name}, which failed")
+        
+        # Update statistics
+        batch_valid = 0
+        batch_invalid = 0
+        for result in batch_results.values():
+            if result['validation'].is_valid:
+                batch_valid += 1
+            else:
+                batch_invalid += 1
+        successful = batch_valid + batch_invalid
+        
+        st.session_state.processed_count += successful
+        st.session_state.valid_count += batch_valid
+        st.session_state.invalid_count += batch_invalid
+        if st.session_state.processed_count:
+            st.session_state.success_rate = st.session_state.valid_count / st.session_state.processed_count * 100
+        
+        # Store results in upload order
+        if 'results' not in st.session_state:
+            st.session_state.results = []
+        
+        st.session_state.results.extend(batch_results[idx] for idx in sorted(batch_results))
+        bump_results_version()
         
         # Clear progress indicators
         progress_bar.empty()
@@ -518,45 +1049,34 @@ with tab1:
             with col1:
                 st.metric("Total Processed", successful)
             with col2:
-                valid = sum(1 for r in st.session_state.results if r['validation'].is_valid)
-                st.metric("Valid", valid, delta=f"{valid/successful*100:.0f}%")
+                st.metric("Valid", batch_valid, delta=f"{batch_valid/successful*100:.0f}%")
             with col3:
-                invalid = successful - valid
-                st.metric("Invalid", invalid, delta=f"{invalid/successful*100:.0f}%" if invalid > 0 else "0%")
+                st.metric("Invalid", batch_invalid, delta=f"{batch_invalid/successful*100:.0f}%" if batch_invalid > 0 else "0%")
             
             st.info("💡 View detailed results in the 'Results' tab")
 
 with tab2:
-    st.header("Processing Results")
-    
-    if 'results' in st.session_state and st.session_state.results:
-        st.write(f"**Total Processed:** {len(st.session_state.results)} invoice(s)")
-        
-        for idx, result in enumerate(st.session_state.results):
-            st.markdown(f"### Invoice {idx + 1}")
-            display_invoice_result(
-                result['invoice'],
-                result['validation'],
-                result['filename']
-            )
-            st.markdown("---")
-    else:
-        st.info("📭 No invoices processed yet. Upload and process an invoice in the 'Upload & Process' tab.")
+    render_results_tab()
 
 with tab3:
     st.header("📈 Processing Dashboard")
     
     if 'results' in st.session_state and st.session_state.results:
         results = st.session_state.results
+        stats = dashboard_stats(st.session_state.results_version, results)
+        
+        # Plotly is only needed once there is something to chart; the import is a
+        # sys.modules lookup after the first time, so this costs nothing on later reruns
+        import plotly.graph_objects as go
         
         # Overview metrics
         st.subheader("Overview")
         col1, col2, col3, col4 = st.columns(4)
         
-        total = len(results)
-        valid = sum(1 for r in results if r['validation'].is_valid)
+        total = stats['total']
+        valid = stats['valid']
         invalid = total - valid
-        total_value = sum(r['invoice'].total_amount for r in results)
+        total_value = stats['total_value']
         
         with col1:
             st.metric("Total Invoices", total)
@@ -592,25 +1112,15 @@ with tab3:
         with col2:
             st.subheader("Invoice Values")
             
-            # Bar chart for invoice values
-            invoice_data = pd.DataFrame([
-                {
-                    'Invoice': r['invoice'].invoice_number,
-                    'Amount': r['invoice'].total_amount,
-                    'Status': 'Valid' if r['validation'].is_valid else 'Invalid'
-                }
-                for r in results
+            # Bar chart for invoice values, one trace per status straight from the arrays
+            fig = go.Figure([
+                go.Bar(x=stats['valid_invoices'], y=stats['valid_amounts'], name='Valid', marker_color='#28a745'),
+                go.Bar(x=stats['invalid_invoices'], y=stats['invalid_amounts'], name='Invalid', marker_color='#dc3545'),
             ])
-            
-            fig = px.bar(
-                invoice_data,
-                x='Invoice',
-                y='Amount',
-                color='Status',
-                color_discrete_map={'Valid': '#28a745', 'Invalid': '#dc3545'},
-                title='Invoice Amounts by Status'
-            )
             fig.update_layout(
+                title='Invoice Amounts by Status',
+                legend_title_text='Status',
+                barmode='relative',
                 height=300,
                 margin=dict(l=20, r=20, t=40, b=20),
                 xaxis_title="",
@@ -627,8 +1137,8 @@ with tab3:
         
         with col1:
             # Count issues and warnings
-            issue_count = sum(len(r['validation'].issues) for r in results)
-            warning_count = sum(len(r['validation'].warnings) for r in results)
+            issue_count = stats['issue_count']
+            warning_count = stats['warning_count']
             
             st.metric("Total Issues", issue_count, delta="Critical" if issue_count > 0 else "None", delta_color="inverse")
             st.metric("Total Warnings", warning_count, delta="Review needed" if warning_count > 0 else "None", delta_color="off")
@@ -636,40 +1146,13 @@ with tab3:
             # Most common issues
             if issue_count > 0:
                 st.markdown("**Most Common Issues:**")
-                all_issues = []
-                for r in results:
-                    all_issues.extend(r['validation'].issues)
-                
-                # Count occurrences
-                from collections import Counter
-                issue_counts = Counter(all_issues)
-                
-                for issue, count in issue_counts.most_common(5):
-                    st.write(f"• {issue[:80]}{'...' if len(issue) > 80 else ''} ({count}x)")
+                for label, count in stats['top_issues']:
+                    st.write(f"• {label} ({count}x)")
         
         with col2:
             # Vendor analysis
-            vendor_data = {}
-            for r in results:
-                vendor = r['invoice'].vendor_name
-                if vendor not in vendor_data:
-                    vendor_data[vendor] = {'count': 0, 'total': 0, 'valid': 0}
-                vendor_data[vendor]['count'] += 1
-                vendor_data[vendor]['total'] += r['invoice'].total_amount
-                if r['validation'].is_valid:
-                    vendor_data[vendor]['valid'] += 1
-            
             st.markdown("**Vendor Summary:**")
-            vendor_df = pd.DataFrame([
-                {
-                    'Vendor': vendor,
-                    'Invoices': data['count'],
-                    'Total': f"${data['total']:,.2f}",
-                    'Valid Rate': f"{data['valid']/data['count']*100:.0f}%"
-                }
-                for vendor, data in vendor_data.items()
-            ])
-            st.dataframe(vendor_df, use_container_width=True, hide_index=True)
+            st.dataframe(stats['vendor_df'], use_container_width=True, hide_index=True)
         
         st.markdown("---")
         
@@ -699,8 +1182,8 @@ with tab3:
         with st.expander("💰 Financial Summary"):
             col1, col2, col3 = st.columns(3)
             
-            total_subtotal = sum(r['invoice'].subtotal for r in results)
-            total_tax = sum(r['invoice'].tax_amount for r in results)
+            total_subtotal = stats['total_subtotal']
+            total_tax = stats['total_tax']
             avg_invoice = total_value / total
             
             with col1:
@@ -709,11 +1192,11 @@ with tab3:
             
             with col2:
                 st.metric("Average Invoice", f"${avg_invoice:,.2f}")
-                highest = max(r['invoice'].total_amount for r in results)
+                highest = stats['highest']
                 st.metric("Highest Invoice", f"${highest:,.2f}")
             
             with col3:
-                total_items = sum(len(r['invoice'].line_items) for r in results)
+                total_items = stats['total_items']
                 st.metric("Total Line Items", total_items)
                 st.metric("Avg Items/Invoice", f"{total_items/total:.1f}")
         
@@ -748,143 +1231,8 @@ with tab3:
         """)
 
 with tab4:
-    st.header("Export Results")
-    
-    if 'results' in st.session_state and st.session_state.results:
-        st.write(f"📊 Export {len(st.session_state.results)} processed invoice(s)")
-        
-        # Export options
-        st.subheader("Choose Export Format")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown("#### 📄 Summary CSV")
-            st.write("Invoice-level summary with validation results")
-            
-            if st.button("Generate Summary CSV", use_container_width=True):
-                df = export_to_csv(st.session_state.results)
-                csv = df.to_csv(index=False)
-                
-                st.download_button(
-                    label="⬇️ Download Summary CSV",
-                    data=csv,
-                    file_name="invoice_summary.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-                
-                with st.expander("Preview Summary CSV"):
-                    st.dataframe(df, use_container_width=True)
-        
-        with col2:
-            st.markdown("#### 🧾 Line Items CSV")
-            st.write("Detailed line-by-line item breakdown")
-            
-            if st.button("Generate Line Items CSV", use_container_width=True):
-                df = export_line_items_to_csv(st.session_state.results)
-                csv = df.to_csv(index=False)
-                
-                st.download_button(
-                    label="⬇️ Download Line Items CSV",
-                    data=csv,
-                    file_name="invoice_line_items.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-                
-                with st.expander("Preview Line Items CSV"):
-                    st.dataframe(df, use_container_width=True)
-        
-        with col3:
-            st.markdown("#### 📦 Complete JSON")
-            st.write("Full data export with all details")
-            
-            # Prepare data for export
-            export_data = []
-            for result in st.session_state.results:
-                export_data.append({
-                    'filename': result['filename'],
-                    'invoice': result['invoice'].to_dict(),
-                    'validation': result['validation'].to_dict()
-                })
-            
-            json_str = json.dumps(export_data, indent=2)
-            
-            st.download_button(
-                label="⬇️ Download JSON",
-                data=json_str,
-                file_name="processed_invoices.json",
-                mime="application/json",
-                use_container_width=True
-            )
-            
-            with st.expander("Preview JSON Structure"):
-                st.json(export_data[0] if export_data else {})
-        
-        # Show export statistics
-        st.markdown("---")
-        st.subheader("Export Statistics")
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        total_amount = sum(r['invoice'].total_amount for r in st.session_state.results)
-        valid_amount = sum(r['invoice'].total_amount for r in st.session_state.results if r['validation'].is_valid)
-        total_items = sum(len(r['invoice'].line_items) for r in st.session_state.results)
-        
-        with col1:
-            st.metric("Total Invoice Value", f"${total_amount:,.2f}")
-        with col2:
-            st.metric("Valid Invoice Value", f"${valid_amount:,.2f}")
-        with col3:
-            st.metric("Total Line Items", total_items)
-        with col4:
-            avg_items = total_items / len(st.session_state.results)
-            st.metric("Avg Items/Invoice", f"{avg_items:.1f}")
-        
-    else:
-        st.info("📭 No results to export yet. Process some invoices first!")
-        
-        st.markdown("---")
-        st.subheader("Available Export Formats")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown("#### 📄 Summary CSV")
-            st.write("""
-            - Invoice number, dates, amounts
-            - Vendor and customer info
-            - Validation status
-            - Issue and warning counts
-            - Perfect for accounting systems
-            """)
-        
-        with col2:
-            st.markdown("#### 🧾 Line Items CSV")
-            st.write("""
-            - Detailed line item breakdown
-            - Item descriptions and quantities
-            - Pricing information
-            - Linked to invoice numbers
-            - Great for inventory tracking
-            """)
-        
-        with col3:
-            st.markdown("#### 📦 Complete JSON")
-            st.write("""
-            - Full structured data export
-            - All extracted fields
-            - Complete validation results
-            - API-ready format
-            - For system integration
-            """)
+    render_export_tab()
 
 # Footer
 st.markdown("---")
-st.markdown("""
-<div style='text-align: center; color: #666; padding: 2rem;'>
-    <p>Built with Streamlit, OpenAI GPT-4, and Python</p>
-    <p>Smart Document Processing Agent v1.0</p>
-</div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
\ No newline at end of file
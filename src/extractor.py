@@ -1,22 +1,22 @@
 import os
+import re
 import json
-from openai import OpenAI
+import asyncio
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from http_pool import shared_http_client, async_http_client
 from models import Invoice, LineItem
 
 load_dotenv()
 
-class InvoiceExtractor:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    def extract_from_text(self, invoice_text: str) -> Invoice:
-        """Extract structured data from invoice text using GPT-4"""
-        
-        prompt = f"""
-Extract ALL information from this invoice and return it as a JSON object with this EXACT structure:
+# Whitespace normalization applied to invoice text before it is prompted (fewer input tokens)
+_LINE_EDGE_SPACE = re.compile(r"[ \t]*\n[ \t]*")
+_SPACE_RUNS = re.compile(r"[ \t]+")
+_BLANK_LINE_RUNS = re.compile(r"\n{3,}")
 
-{{
+# JSON structure the model is asked to return for an invoice
+INVOICE_JSON_SCHEMA = """{
     "invoice_number": "string",
     "invoice_date": "string",
     "due_date": "string",
@@ -24,73 +24,165 @@ Extract ALL information from this invoice and return it as a JSON object with th
     "vendor_abn": "string or null",
     "customer_name": "string",
     "line_items": [
-        {{
+        {
             "description": "string",
             "quantity": number,
             "unit_price": number,
             "amount": number
-        }}
+        }
     ],
     "subtotal": number,
     "tax_amount": number,
     "total_amount": number
-}}
+}"""
+
+# Response cap for an extraction; ~30 tokens per line item leaves room for 100+ items
+EXTRACTION_MAX_TOKENS = 4096
+
+# Static prompt pieces, built once at import; only the invoice text is spliced in per call
+_EXTRACT_PROMPT_HEAD = f"""
+Extract ALL information from this invoice and return it as a JSON object with this EXACT structure:
+
+{INVOICE_JSON_SCHEMA}
 
 Invoice text:
-{invoice_text}
+"""
+
+_EXTRACT_PROMPT_TAIL = """
 
 Return ONLY the JSON object, no other text.
 """
+
+_EXTRACT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert at extracting structured data from invoices. Always return valid JSON."
+}
+
+class InvoiceExtractor:
+    def __init__(self):
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=shared_http_client)
+    
+    def _normalize(self, invoice_text: str) -> str:
+        """Collapse whitespace runs and extra blank lines, which cost tokens but carry no data"""
+        text = invoice_text.replace("\r\n", "\n")
+        text = _LINE_EDGE_SPACE.sub("\n", text)
+        text = _SPACE_RUNS.sub(" ", text)
+        text = _BLANK_LINE_RUNS.sub("\n\n", text)
+        return text.strip()
+    
+    def _build_messages(self, invoice_text: str) -> list:
+        """Build the chat messages for an extraction request"""
+        
+        prompt = f"{_EXTRACT_PROMPT_HEAD}{invoice_text}{_EXTRACT_PROMPT_TAIL}"
+        
+        return [_EXTRACT_SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
+    
+    def _parse_response(self, content: str, invoice_text: str) -> Invoice:
+        """Convert the model's JSON response into an Invoice"""
+        
+        # Parse JSON response
+        return self._invoice_from_data(json.loads(content), invoice_text)
+    
+    def _invoice_from_data(self, extracted_data: dict, invoice_text: str) -> Invoice:
+        """Build an Invoice from the decoded extraction fields"""
+        
+        # Coerce every line item number in one pass; the model may return ints
+        # or numeric strings. numpy turns a null into NaN rather than raising,
+        # so anything non-finite is rejected explicitly
+        items = extracted_data["line_items"]
+        numbers = np.array(
+            [(item["quantity"], item["unit_price"], item["amount"]) for item in items],
+            dtype=np.float64
+        ).reshape(-1, 3)
+        if not np.isfinite(numbers).all():
+            raise ValueError("line item quantity, unit_price and amount must be numbers")
+        numbers = numbers.tolist()
+        
+        # Convert to Invoice object
+        line_items = [
+            LineItem(
+                description=item["description"],
+                quantity=quantity,
+                unit_price=unit_price,
+                amount=amount
+            )
+            for item, (quantity, unit_price, amount) in zip(items, numbers)
+        ]
+        
+        return Invoice(
+            invoice_number=extracted_data["invoice_number"],
+            invoice_date=extracted_data["invoice_date"],
+            due_date=extracted_data["due_date"],
+            vendor_name=extracted_data["vendor_name"],
+            vendor_abn=extracted_data.get("vendor_abn"),
+            customer_name=extracted_data["customer_name"],
+            line_items=line_items,
+            subtotal=float(extracted_data["subtotal"]),
+            tax_amount=float(extracted_data["tax_amount"]),
+            total_amount=float(extracted_data["total_amount"]),
+            raw_text=invoice_text
+        )
+    
+    def extract_from_text(self, invoice_text: str) -> Invoice:
+        """Extract structured data from invoice text using GPT-4"""
+        
+        # Normalized once; the same text is prompted and kept as raw_text
+        invoice_text = self._normalize(invoice_text)
         
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert at extracting structured data from invoices. Always return valid JSON."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(invoice_text),
                 temperature=0,
+                max_tokens=EXTRACTION_MAX_TOKENS,
                 response_format={"type": "json_object"}  # Force JSON output
             )
             
-            # Parse JSON response
-            extracted_data = json.loads(response.choices[0].message.content)
-            
-            # Convert to Invoice object
-            line_items = [
-                LineItem(
-                    description=item["description"],
-                    quantity=float(item["quantity"]),
-                    unit_price=float(item["unit_price"]),
-                    amount=float(item["amount"])
-                )
-                for item in extracted_data["line_items"]
-            ]
+            return self._parse_response(response.choices[0].message.content, invoice_text)
             
-            invoice = Invoice(
-                invoice_number=extracted_data["invoice_number"],
-                invoice_date=extracted_data["invoice_date"],
-                due_date=extracted_data["due_date"],
-                vendor_name=extracted_data["vendor_name"],
-                vendor_abn=extracted_data.get("vendor_abn"),
-                customer_name=extracted_data["customer_name"],
-                line_items=line_items,
-                subtotal=float(extracted_data["subtotal"]),
-                tax_amount=float(extracted_data["tax_amount"]),
-                total_amount=float(extracted_data["total_amount"]),
-                raw_text=invoice_text
+        except Exception as e:
+            raise Exception(f"Extraction failed: {str(e)}")
+    
+    async def extract_from_text_async(self, invoice_text: str, client: AsyncOpenAI) -> Invoice:
+        """Async variant of extract_from_text using the given AsyncOpenAI client"""
+        
+        # Normalized once; the same text is prompted and kept as raw_text
+        invoice_text = self._normalize(invoice_text)
+        
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self._build_messages(invoice_text),
+                temperature=0,
+                max_tokens=EXTRACTION_MAX_TOKENS,
+                response_format={"type": "json_object"}  # Force JSON output
             )
             
-            return invoice
+            return self._parse_response(response.choices[0].message.content, invoice_text)
             
         except Exception as e:
             raise Exception(f"Extraction failed: {str(e)}")
     
+    async def extract_many_async(self, invoice_texts: list, max_concurrency: int = 8) -> list:
+        """Extract several invoices concurrently over a single async client.
+        
+        Returns a list aligned with invoice_texts; a failed extraction is
+        returned in place as its exception.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=async_http_client()) as client:
+            async def extract_one(invoice_text):
+                async with semaphore:
+                    return await self.extract_from_text_async(invoice_text, client)
+            
+            return await asyncio.gather(
+                *(extract_one(text) for text in invoice_texts),
+                return_exceptions=True
+            )
+    
     def extract_from_file(self, file_path: str) -> Invoice:
         """Extract from a text file"""
         with open(file_path, 'r') as f:
             invoice_text = f.read()
-        return self.extract_from_text(invoice_text)
\ No newline at end of file
+        return self.extract_from_text(invoice_text)
@@ -0,0 +1,17 @@
+import httpx
+from openai import DEFAULT_TIMEOUT, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+# Pool bounds for OpenAI traffic; a batch's concurrent requests fit comfortably
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+# A custom client's timeout replaces the SDK's, so keep the SDK default: connects
+# fail fast (5s) but reads get the full 600s a long fused extraction + review can
+# need, rather than timing out and being retried from scratch
+HTTP_TIMEOUT = DEFAULT_TIMEOUT
+
+# One HTTP/2 connection pool shared by every sync OpenAI client in the process,
+# so concurrent requests multiplex over a single TLS session
+shared_http_client = DefaultHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+def async_http_client() -> httpx.AsyncClient:
+    """A fresh HTTP/2 client for an AsyncOpenAI client (async pools are bound to one event loop)"""
+    return DefaultAsyncHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
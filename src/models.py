@@ -1,15 +1,16 @@
 from dataclasses import dataclass
 from typing import List, Optional
 from datetime import datetime
+import numpy as np
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LineItem:
     description: str
     quantity: float
     unit_price: float
     amount: float
 
-@dataclass
+@dataclass(slots=True)
 class Invoice:
     invoice_number: str
     invoice_date: str
@@ -23,6 +24,14 @@ class Invoice:
     total_amount: float
     raw_text: str
     
+    def as_arrays(self):
+        """Line item quantities, unit prices and amounts as parallel float64 arrays"""
+        n = len(self.line_items)
+        quantities = np.fromiter((item.quantity for item in self.line_items), dtype=np.float64, count=n)
+        unit_prices = np.fromiter((item.unit_price for item in self.line_items), dtype=np.float64, count=n)
+        amounts = np.fromiter((item.amount for item in self.line_items), dtype=np.float64, count=n)
+        return quantities, unit_prices, amounts
+    
     def to_dict(self):
         return {
             "invoice_number": self.invoice_number,
@@ -45,7 +54,7 @@ class Invoice:
             "total_amount": self.total_amount
         }
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ValidationResult:
     is_valid: bool
     issues: List[str]
@@ -1,17 +1,114 @@
 import os
+import re
 import json
-from openai import OpenAI
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from http_pool import shared_http_client, async_http_client
 from models import Invoice, ValidationResult
 from validator import InvoiceValidator
 
 load_dotenv()
 
+# What the AI review should (and should not) flag; shared with the fused DocumentAgent prompt
+REVIEW_GUIDELINES = """ONLY flag issues that are EXPLICITLY concerning. Look for:
+
+CRITICAL ISSUES (flag as issues):
+1. Explicit warnings about duplicates, errors, or fraud mentioned in the invoice text
+2. Changed bank account details mentioned in notes
+3. Requests for unusual payment methods (gift cards, cryptocurrency, etc.)
+4. Invoices marked as "VOID", "CANCELLED", or "DUPLICATE" in the text
+
+WARNINGS (flag as warnings):
+1. Very high individual line items (over $15,000 for a single item)
+2. Missing critical vendor information (no ABN, no address)
+3. Unusual payment terms mentioned in notes
+
+DO NOT FLAG:
+- Round numbers (these are normal)
+- Standard payment terms (Net 30, Net 60)
+- High but reasonable amounts for business purchases
+- Normal business transactions
+
+Be conservative - only flag things that would genuinely concern an experienced accountant."""
+
+# Static end of the analysis prompt (guidelines and response format), built once at import
+_ANALYSIS_PROMPT_TAIL = f"""
+
+{REVIEW_GUIDELINES}
+
+Return a JSON object:
+{{
+    "has_issues": true/false,
+    "critical_issues": ["only serious problems that make invoice definitely invalid"],
+    "warnings": ["only genuine concerns that need human review"]
+}}
+
+If the invoice looks normal, return empty arrays. Return ONLY the JSON object.
+"""
+
+_ANALYSIS_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an experienced financial auditor. You flag issues conservatively - only when there are genuine red flags, not for normal business transactions."
+}
+
+# Response cap for an analysis; clean verdicts are ~20 tokens, a few findings well under this
+ANALYSIS_MAX_TOKENS = 512
+
+# In validate/validate_async (the two-step extract-then-review path, e.g. test_pipeline),
+# clean invoices below this total skip the AI review unless their text looks suspicious.
+# The app's fused DocumentAgent call reviews as it extracts, so there's nothing to skip
+FAST_PATH_MAX_TOTAL = 5000
+
+# Cheap local screen for the red flags the AI review exists to catch
+_SUSPICIOUS_TEXT = re.compile(
+    r"\b(VOID|CANCELL?ED|DUPLICATE|fraud\w*|bitcoin|crypto\w*|gift ?cards?|(changed|new) (bank|account))\b",
+    re.IGNORECASE
+)
+
+ANALYSIS_CACHE_SIZE = 256  # AI analyses kept, keyed by the SHA-256 of their prompt
+
+# Shared by every SmartValidator in the process: an analysis only depends on its
+# prompt, so an identical invoice re-uploaded in any session skips the API call
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+def _cached_analysis(key: str) -> Optional[ValidationResult]:
+    with _analysis_cache_lock:
+        result = _analysis_cache.get(key)
+        if result is not None:
+            _analysis_cache.move_to_end(key)
+        return result
+
+def _store_analysis(key: str, result: ValidationResult):
+    with _analysis_cache_lock:
+        _analysis_cache[key] = result
+        _analysis_cache.move_to_end(key)
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+def _merge_unique(rule_findings: list, ai_findings: list) -> list:
+    """Rule findings followed by any new AI findings, order preserved"""
+    
+    # The AI review is told to be conservative, so it usually adds nothing;
+    # then the rule list is passed through as is
+    if not ai_findings:
+        return rule_findings
+    
+    # dict.fromkeys dedups in C, faster than a Python seen-set loop
+    return list(dict.fromkeys(rule_findings + ai_findings))
+
 class SmartValidator:
     """Enhanced validator that combines rule-based checks with AI analysis"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, client: Optional[OpenAI] = None):
+        # Accept an existing client so callers can share one connection pool
+        self.client = client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=shared_http_client)
         self.rule_validator = InvoiceValidator()
     
     def validate(self, invoice: Invoice) -> ValidationResult:
@@ -19,17 +116,72 @@ class SmartValidator:
         
         # First, run traditional rule-based validation
         rule_validation = self.rule_validator.validate(invoice)
+        if self._skip_ai_review(invoice, rule_validation):
+            return rule_validation
         
         # Then, run AI analysis on the raw invoice text
         ai_validation = self._ai_analyze(invoice)
         
-        # Combine results
-        combined_issues = rule_validation.issues + ai_validation.issues
-        combined_warnings = rule_validation.warnings + ai_validation.warnings
+        return self._combine(rule_validation, ai_validation)
+    
+    def validate_with_analysis(self, invoice: Invoice, ai_validation: ValidationResult) -> ValidationResult:
+        """Run the rule-based checks and merge them with an AI analysis obtained elsewhere
+        (e.g. from DocumentAgent, which reviews the invoice in its extraction call)"""
+        
+        rule_validation = self.rule_validator.validate(invoice)
+        
+        return self._combine(rule_validation, ai_validation)
+    
+    async def validate_async(self, invoice: Invoice, client: AsyncOpenAI) -> ValidationResult:
+        """Async variant of validate using the given AsyncOpenAI client"""
+        
+        # Rule checks are local and instant; they run before the first await so
+        # duplicate detection still sees invoices in submission order
+        rule_validation = self.rule_validator.validate(invoice)
+        if self._skip_ai_review(invoice, rule_validation):
+            return rule_validation
+        ai_validation = await self._ai_analyze_async(invoice, client)
+        
+        return self._combine(rule_validation, ai_validation)
+    
+    async def validate_many_async(self, invoices: list, max_concurrency: int = 8) -> list:
+        """Validate several invoices with their AI analyses running concurrently.
+        
+        Returns a list aligned with invoices; a failed validation is returned
+        in place as its exception.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        # Remove duplicates while preserving order
-        combined_issues = list(dict.fromkeys(combined_issues))
-        combined_warnings = list(dict.fromkeys(combined_warnings))
+        async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=async_http_client()) as client:
+            async def validate_one(invoice):
+                async with semaphore:
+                    return await self.validate_async(invoice, client)
+            
+            return await asyncio.gather(
+                *(validate_one(invoice) for invoice in invoices),
+                return_exceptions=True
+            )
+    
+    def _skip_ai_review(self, invoice: Invoice, rule_validation: ValidationResult) -> bool:
+        """True when local checks show nothing the AI review could plausibly flag:
+        rules passed cleanly, a modest total, an ABN on file and no red-flag wording.
+        
+        Only consulted by validate and validate_async; validate_with_analysis is handed
+        a review that already came back with the extraction.
+        """
+        return (
+            not rule_validation.issues
+            and not rule_validation.warnings
+            and invoice.total_amount < FAST_PATH_MAX_TOTAL
+            and bool(invoice.vendor_abn)
+            and _SUSPICIOUS_TEXT.search(invoice.raw_text) is None
+        )
+    
+    def _combine(self, rule_validation: ValidationResult, ai_validation: ValidationResult) -> ValidationResult:
+        """Merge rule-based and AI results into one ValidationResult"""
+        
+        combined_issues = _merge_unique(rule_validation.issues, ai_validation.issues)
+        combined_warnings = _merge_unique(rule_validation.warnings, ai_validation.warnings)
         
         is_valid = len(combined_issues) == 0
         
@@ -39,81 +191,87 @@ class SmartValidator:
             warnings=combined_warnings
         )
     
-    def _ai_analyze(self, invoice: Invoice) -> ValidationResult:
-        """Use AI to analyze invoice for suspicious patterns or explicit warnings"""
+    def _build_messages(self, invoice: Invoice) -> list:
+        """Build the chat messages for an AI analysis request"""
     
         # Get current date for context
-        from datetime import datetime
         current_date = datetime.now().strftime("%B %d, %Y")
         
         prompt = f"""
-    You are analyzing an invoice for a finance team. Today's date is {current_date}.
-
-    Invoice Details:
-    - Number: {invoice.invoice_number}
-    - Vendor: {invoice.vendor_name}
-    - Total: ${invoice.total_amount:,.2f}
-    - Date: {invoice.invoice_date}
-
-    Raw Invoice Text:
-    {invoice.raw_text}
-
-    ONLY flag issues that are EXPLICITLY concerning. Look for:
-
-    CRITICAL ISSUES (flag as issues):
-    1. Explicit warnings about duplicates, errors, or fraud mentioned in the invoice text
-    2. Changed bank account details mentioned in notes
-    3. Requests for unusual payment methods (gift cards, cryptocurrency, etc.)
-    4. Invoices marked as "VOID", "CANCELLED", or "DUPLICATE" in the text
-
-    WARNINGS (flag as warnings):
-    1. Very high individual line items (over $15,000 for a single item)
-    2. Missing critical vendor information (no ABN, no address)
-    3. Unusual payment terms mentioned in notes
-
-    DO NOT FLAG:
-    - Round numbers (these are normal)
-    - Standard payment terms (Net 30, Net 60)
-    - High but reasonable amounts for business purchases
-    - Normal business transactions
+You are analyzing an invoice for a finance team. Today's date is {current_date}.
 
-    Be conservative - only flag things that would genuinely concern an experienced accountant.
-
-    Return a JSON object:
-    {{
-        "has_issues": true/false,
-        "critical_issues": ["only serious problems that make invoice definitely invalid"],
-        "warnings": ["only genuine concerns that need human review"]
-    }}
-
-    If the invoice looks normal, return empty arrays. Return ONLY the JSON object.
-    """
+Raw Invoice Text:
+{invoice.raw_text}{_ANALYSIS_PROMPT_TAIL}"""
+        
+        return [_ANALYSIS_SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
+    
+    def _parse_analysis(self, content: str) -> ValidationResult:
+        """Convert the model's JSON analysis into a ValidationResult"""
+        
+        analysis = json.loads(content)
+        
+        issues = analysis.get("critical_issues", [])
+        warnings = analysis.get("warnings", [])
+        
+        return ValidationResult(
+            is_valid=len(issues) == 0,
+            issues=issues,
+            warnings=warnings
+        )
+    
+    def _ai_analyze(self, invoice: Invoice) -> ValidationResult:
+        """Use AI to analyze invoice for suspicious patterns or explicit warnings"""
+        
+        # The prompt embeds today's date and the raw text, so it is the whole cache key
+        messages = self._build_messages(invoice)
+        key = hashlib.sha256(messages[-1]["content"].encode("utf-8")).hexdigest()
+        cached = _cached_analysis(key)
+        if cached is not None:
+            return cached
         
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an experienced financial auditor. You flag issues conservatively - only when there are genuine red flags, not for normal business transactions."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 temperature=0,
+                max_tokens=ANALYSIS_MAX_TOKENS,
                 response_format={"type": "json_object"}
             )
             
-            analysis = json.loads(response.choices[0].message.content)
-            
-            issues = analysis.get("critical_issues", [])
-            warnings = analysis.get("warnings", [])
+            # Only successful analyses are cached; failures are retried next time
+            result = self._parse_analysis(response.choices[0].message.content)
+            _store_analysis(key, result)
+            return result
             
-            return ValidationResult(
-                is_valid=len(issues) == 0,
-                issues=issues,
-                warnings=warnings
+        except Exception as e:
+            # If AI analysis fails, return empty validation
+            print(f"AI validation failed: {e}")
+            return ValidationResult(is_valid=True, issues=[], warnings=[])
+    
+    async def _ai_analyze_async(self, invoice: Invoice, client: AsyncOpenAI) -> ValidationResult:
+        """Async variant of _ai_analyze using the given AsyncOpenAI client"""
+        
+        # The prompt embeds today's date and the raw text, so it is the whole cache key
+        messages = self._build_messages(invoice)
+        key = hashlib.sha256(messages[-1]["content"].encode("utf-8")).hexdigest()
+        cached = _cached_analysis(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0,
+                max_tokens=ANALYSIS_MAX_TOKENS,
+                response_format={"type": "json_object"}
             )
             
+            # Only successful analyses are cached; failures are retried next time
+            result = self._parse_analysis(response.choices[0].message.content)
+            _store_analysis(key, result)
+            return result
+            
         except Exception as e:
             # If AI analysis fails, return empty validation
             print(f"AI validation failed: {e}")
@@ -1,6 +1,45 @@
 from extractor import InvoiceExtractor
 from smart_validator import SmartValidator
-import json
+import os
+import orjson
+import asyncio
+import hashlib
+
+async def process_all(extractor, validator, texts):
+    """Extract every invoice concurrently, then run all AI validations concurrently.
+    
+    Returns (invoice, validation) pairs aligned with texts; a failed step is
+    returned in place as its exception.
+    """
+    extracted = await extractor.extract_many_async(texts)
+    
+    invoices = [invoice for invoice in extracted if not isinstance(invoice, Exception)]
+    validations = iter(await validator.validate_many_async(invoices))
+    
+    return [
+        (invoice, invoice if isinstance(invoice, Exception) else next(validations))
+        for invoice in extracted
+    ]
+
+def output_path(invoice_file):
+    return f"output/processed_{invoice_file.replace('.txt', '.json')}"
+
+def stored_digest(output_file):
+    """Skip key saved alongside output_file, or None if there's no result yet"""
+    try:
+        with open(f"{output_file}.hash", 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def saved_result(output_file):
+    """A previously saved result, or None if it's missing or unreadable (so it gets redone)"""
+    try:
+        with open(output_file, 'rb') as f:
+            result = orjson.loads(f.read())
+        return result if "invoice_number" in result["invoice"] else None
+    except (OSError, orjson.JSONDecodeError, KeyError, TypeError):
+        return None
 
 def test_full_pipeline():
     extractor = InvoiceExtractor()
@@ -9,42 +48,69 @@ def test_full_pipeline():
     print("Testing Complete Document Processing Pipeline")
     print("="*70)
     
-    invoices = ["sample_invoice_1.txt", "sample_invoice_2.txt", "sample_invoice_3.txt"]
+    # Every .txt invoice in data/, in name order
+    with os.scandir("data") as entries:
+        invoices = sorted(
+            entry.name for entry in entries
+            if entry.name.endswith('.txt') and entry.is_file(follow_symlinks=False)
+        )
     
+    # Steps 1 & 2: Extract and validate all invoices up front so the API calls overlap
+    print("Extracting data...")
+    print("Running validation checks and AI analysis...")
+    # Duplicate detection makes each result depend on every earlier input, so the skip
+    # key chains the names and bytes of all inputs up to this one, and once one input
+    # needs processing every later one is processed too
+    chain = hashlib.blake2b(digest_size=16)
+    pending, texts, digests = [], [], []
     for invoice_file in invoices:
-        print(f"\nProcessing: {invoice_file}")
-        print("-"*70)
+        with open(f"data/{invoice_file}", 'rb') as f:
+            raw = f.read()
+        chain.update(f"{invoice_file}\0{len(raw)}\0".encode('utf-8'))
+        chain.update(raw)
+        digest = chain.hexdigest()
+        output_file = output_path(invoice_file)
+        saved = saved_result(output_file) if not pending and stored_digest(output_file) == digest else None
+        if saved is not None:
+            print(f"Unchanged since last run, skipping: {invoice_file}")
+            # Later inputs must still be checked against this invoice's number
+            validator.rule_validator.remember_invoice_number(saved["invoice"]["invoice_number"])
+            continue
+        pending.append(invoice_file)
+        texts.append(raw.decode('utf-8'))
+        digests.append(digest)
+    processed = asyncio.run(process_all(extractor, validator, texts)) if texts else []
+    
+    for invoice_file, digest, (invoice, validation) in zip(pending, digests, processed):
+        # Each invoice's report is collected and written in one go
+        report = [f"\nProcessing: {invoice_file}", "-"*70]
         
         try:
-            # Step 1: Extract
-            print("Extracting data...")
-            invoice = extractor.extract_from_file(f"data/{invoice_file}")
-            print(f"Extracted {len(invoice.line_items)} line items")
-            
-            # Step 2: Validate
-            print("Running validation checks...")
-            print("Running AI analysis...")
-            validation = validator.validate(invoice)
+            if isinstance(invoice, Exception):
+                raise invoice
+            if isinstance(validation, Exception):
+                raise validation
+            report.append(f"Extracted {len(invoice.line_items)} line items")
             
             # Step 3: Report
-            print(f"\nRESULTS:")
-            print(f"   Invoice: {invoice.invoice_number}")
-            print(f"   Vendor: {invoice.vendor_name}")
-            print(f"   Total: ${invoice.total_amount:,.2f}")
-            print(f"   Status: {'VALID' if validation.is_valid else 'INVALID'}")
+            report.append(f"\nRESULTS:")
+            report.append(f"   Invoice: {invoice.invoice_number}")
+            report.append(f"   Vendor: {invoice.vendor_name}")
+            report.append(f"   Total: ${invoice.total_amount:,.2f}")
+            report.append(f"   Status: {'VALID' if validation.is_valid else 'INVALID'}")
             
             if validation.issues:
-                print(f"\nISSUES ({len(validation.issues)}):")
+                report.append(f"\nISSUES ({len(validation.issues)}):")
                 for issue in validation.issues:
-                    print(f"   • {issue}")
+                    report.append(f"   • {issue}")
             
             if validation.warnings:
-                print(f"\nWARNINGS ({len(validation.warnings)}):")
+                report.append(f"\nWARNINGS ({len(validation.warnings)}):")
                 for warning in validation.warnings:
-                    print(f"   • {warning}")
+                    report.append(f"   • {warning}")
             
             if not validation.issues and not validation.warnings:
-                print(f"\nNo issues or warnings detected")
+                report.append(f"\nNo issues or warnings detected")
             
             # Save results
             result = {
@@ -52,19 +118,21 @@ def test_full_pipeline():
                 "validation": validation.to_dict()
             }
             
-            output_file = f"output/processed_{invoice_file.replace('.txt', '.json')}"
-            with open(output_file, 'w') as f:
-                json.dump(result, f, indent=2)
-            print(f"\nSaved results to: {output_file}")
+            output_file = output_path(invoice_file)
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+            with open(f"{output_file}.hash", 'w') as f:
+                f.write(digest)
+            report.append(f"\nSaved results to: {output_file}")
             
         except Exception as e:
-            print(f"Error: {e}")
+            report.append(f"Error: {e}")
         
-        print("-"*70)
+        report.append("-"*70)
+        print("\n".join(report), flush=True)
     
     print("\nPipeline test complete!")
 
 if __name__ == "__main__":
-    import os
     os.makedirs("output", exist_ok=True)
     test_full_pipeline()
\ No newline at end of file
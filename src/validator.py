@@ -1,88 +1,127 @@
 from models import Invoice, ValidationResult
 from typing import List, Set
 import re
+import numpy as np
+import threading
+
+# An ABN is 11 digits, with any spacing or punctuation between them. \d and \D are
+# disjoint, so a fullmatch is a single linear scan with no backtracking
+_ABN_FORMAT = re.compile(r'\D*(?:\d\D*){11}')
+
+def _check_line_items(quantities, unit_prices, amounts, max_line_item):
+    """Line item arithmetic for checks 3 and 7 in one place.
+    
+    Returns the line item sum in cents, each item's quantity x unit price, and
+    the indices of items whose amount doesn't match it or exceeds max_line_item.
+    """
+    expected_amounts = quantities * unit_prices
+    # Whole cents, like checks 3-5, so the 1 cent tolerance is an exact integer compare
+    amount_cents = np.rint(amounts * 100).astype(np.int64)
+    expected_cents = np.rint(expected_amounts * 100).astype(np.int64)
+    calculated_subtotal_cents = int(amount_cents.sum())
+    mismatched = np.flatnonzero(np.abs(expected_cents - amount_cents) > 1)
+    high_value = np.flatnonzero(amounts > max_line_item)
+    return calculated_subtotal_cents, expected_amounts, mismatched, high_value
 
 class InvoiceValidator:
     def __init__(self):
         self.processed_invoices: Set[str] = set()  # Track invoice numbers
+        self._lock = threading.Lock()  # Guards processed_invoices across worker threads
         self.validation_rules = {
             "max_total": 50000.00,  # Flag invoices over $50k
             "max_line_item": 10000.00,  # Flag individual items over $10k
             "required_fields": ["invoice_number", "vendor_name", "total_amount"]
         }
+        # Thresholds read on every validate() call, bound once
+        self._max_total = self.validation_rules["max_total"]
+        self._max_line_item = self.validation_rules["max_line_item"]
+        self._required_fields = tuple(self.validation_rules["required_fields"])
     
     def validate(self, invoice: Invoice) -> ValidationResult:
         """Run all validation checks on an invoice"""
+        # Amounts are read by several checks; bind them once
+        subtotal = invoice.subtotal
+        tax_amount = invoice.tax_amount
+        total_amount = invoice.total_amount
+        
         issues = []
         warnings = []
         
         # Check 1: Required fields
-        if not invoice.invoice_number:
-            issues.append("Missing invoice number")
-        if not invoice.vendor_name:
-            issues.append("Missing vendor name")
-        if not invoice.total_amount:
-            issues.append("Missing total amount")
-        
-        # Check 2: Duplicate detection
-        if invoice.invoice_number in self.processed_invoices:
+        issues.extend(
+            f"Missing {field.replace('_', ' ')}"
+            for field in self._required_fields
+            if not getattr(invoice, field)
+        )
+        
+        # Check 2: Duplicate detection (a local set lookup; the AI review can't see other invoices)
+        if self.remember_invoice_number(invoice.invoice_number):
             issues.append(f"DUPLICATE: Invoice {invoice.invoice_number} already processed")
-        else:
-            self.processed_invoices.add(invoice.invoice_number)
+        
+        # Line item arithmetic for checks 3 and 7, done once in vectorized form
+        calculated_subtotal_cents, expected_amounts, mismatched, high_value = _check_line_items(
+            *invoice.as_arrays(), self._max_line_item
+        )
+        
+        # Checks 3-5 compare whole cents, each field rounded once, so a 1 cent
+        # tolerance is exact instead of subject to float artifacts
+        subtotal_cents = round(subtotal * 100)
+        tax_cents = round(tax_amount * 100)
+        total_cents = round(total_amount * 100)
         
         # Check 3: Math validation
-        calculated_subtotal = sum(item.amount for item in invoice.line_items)
-        if abs(calculated_subtotal - invoice.subtotal) > 0.01:  # Allow 1 cent rounding
+        if abs(calculated_subtotal_cents - subtotal_cents) > 1:  # Allow 1 cent rounding
             issues.append(
-                f"Subtotal mismatch: Line items sum to ${calculated_subtotal:.2f} "
-                f"but subtotal is ${invoice.subtotal:.2f}"
+                f"Subtotal mismatch: Line items sum to ${calculated_subtotal_cents / 100:.2f} "
+                f"but subtotal is ${subtotal:.2f}"
             )
         
-        # Check 4: Tax calculation (assuming 10% GST)
-        expected_tax = invoice.subtotal * 0.10
-        if abs(expected_tax - invoice.tax_amount) > 0.01:
+        # Check 4: Tax calculation (assuming 10% GST, rounded half up to the cent)
+        expected_tax_cents = (subtotal_cents + 5) // 10
+        if abs(expected_tax_cents - tax_cents) > 1:
             warnings.append(
-                f"Tax amount ${invoice.tax_amount:.2f} doesn't match "
-                f"expected 10% GST of ${expected_tax:.2f}"
+                f"Tax amount ${tax_amount:.2f} doesn't match "
+                f"expected 10% GST of ${expected_tax_cents / 100:.2f}"
             )
         
         # Check 5: Total calculation
-        expected_total = invoice.subtotal + invoice.tax_amount
-        if abs(expected_total - invoice.total_amount) > 0.01:
+        expected_total_cents = subtotal_cents + tax_cents
+        if abs(expected_total_cents - total_cents) > 1:
             issues.append(
-                f"Total mismatch: ${invoice.subtotal:.2f} + ${invoice.tax_amount:.2f} "
-                f"= ${expected_total:.2f}, but total shows ${invoice.total_amount:.2f}"
+                f"Total mismatch: ${subtotal:.2f} + ${tax_amount:.2f} "
+                f"= ${expected_total_cents / 100:.2f}, but total shows ${total_amount:.2f}"
             )
         
         # Check 6: High value warnings
-        if invoice.total_amount > self.validation_rules["max_total"]:
+        max_total = self._max_total
+        if total_amount > max_total:
             warnings.append(
-                f"HIGH VALUE: Total ${invoice.total_amount:,.2f} exceeds "
-                f"${self.validation_rules['max_total']:,.2f} threshold"
+                f"HIGH VALUE: Total ${total_amount:,.2f} exceeds "
+                f"${max_total:,.2f} threshold"
             )
         
         # Check 7: Individual line item checks
-        for item in invoice.line_items:
-            if item.amount > self.validation_rules["max_line_item"]:
-                warnings.append(
-                    f"High value line item: '{item.description}' "
-                    f"= ${item.amount:,.2f}"
-                )
-            
-            # Check line item math
-            expected_amount = item.quantity * item.unit_price
-            if abs(expected_amount - item.amount) > 0.01:
-                issues.append(
-                    f"Line item math error: '{item.description}' "
-                    f"- {item.quantity} x ${item.unit_price:.2f} "
-                    f"= ${expected_amount:.2f}, but shows ${item.amount:.2f}"
-                )
+        # Only the offending items are formatted
+        items = invoice.line_items
+        for i in high_value:
+            item = items[i]
+            warnings.append(
+                f"High value line item: '{item.description}' "
+                f"= ${item.amount:,.2f}"
+            )
+        
+        # Check line item math
+        for i in mismatched:
+            item = items[i]
+            issues.append(
+                f"Line item math error: '{item.description}' "
+                f"- {item.quantity} x ${item.unit_price:.2f} "
+                f"= ${expected_amounts[i]:.2f}, but shows ${item.amount:.2f}"
+            )
         
         # Check 8: ABN format (Australian Business Number)
-        if invoice.vendor_abn:
-            abn_clean = re.sub(r'[^\d]', '', invoice.vendor_abn)
-            if len(abn_clean) != 11:
-                warnings.append(f"ABN format may be invalid: {invoice.vendor_abn}")
+        if invoice.vendor_abn and not _ABN_FORMAT.fullmatch(invoice.vendor_abn):
+            warnings.append(f"ABN format may be invalid: {invoice.vendor_abn}")
         
         # Check 9: Date validation (basic)
         if not invoice.invoice_date or not invoice.due_date:
@@ -96,6 +135,23 @@ class InvoiceValidator:
             warnings=warnings
         )
     
+    def remember_invoice_number(self, invoice_number) -> bool:
+        """Record an invoice number for duplicate detection; True if it was already seen.
+        
+        Keyed on the trimmed number (as text; the model sometimes returns a bare number)
+        so stray whitespace from extraction can't hide a repeat. A missing number is
+        reported by the required-field check instead and isn't tracked.
+        """
+        duplicate_key = str(invoice_number or "").strip()
+        if not duplicate_key:
+            return False
+        
+        # One add under the lock; an unchanged size means the number was already seen
+        with self._lock:
+            seen_before = len(self.processed_invoices)
+            self.processed_invoices.add(duplicate_key)
+            return len(self.processed_invoices) == seen_before
+    
     def reset(self):
         """Reset processed invoices (for testing)"""
         self.processed_invoices.clear()
\ No newline at end of file